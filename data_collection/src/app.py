@@ -16,6 +16,7 @@ import os
 import signal
 import sys
 import json
+import logging
 from commons.commons import (
     BLE_ADDR_SENSOR_BACK,
     MQTT_CLASSIFICATION_BACKWARD, 
@@ -42,10 +43,32 @@ from time import (
     sleep
 )
 
-TIME_BETWEEN_READINGS = 0.5 # seconds
+DISCOVERY_BACKOFF_START = 0.5 # seconds
+DISCOVERY_BACKOFF_MAX = 8.0 # seconds
+NOTIFY_TIMEOUT = 5.0 # seconds without a notification before a sensor is treated as dead
+READINGS_BUFFER_LEN = 16 # readings kept per sub sensor
+# Published key prefixes, in the order of the concatenated acc, mag and gyro readings
+READING_KEYS = ["accX_", "accY_", "accZ_", "magX_", "magY_", "magZ_", "gyroX_", "gyroY_", "gyroZ_"]
 PATH = "./samples"
 
-led_and_buzzer = None
+# Per-reading output goes through the logger, so it costs nothing unless DEBUG is enabled
+log = logging.getLogger("sensortag")
+
+# Precompiled packet layouts, so the notify callbacks do not re-parse format strings
+_CTRL_STRUCT = struct.Struct("<H")
+_HUMID_STRUCT = struct.Struct("<HH")
+_INV_65536 = 1.0 / 65536.0
+
+# Preallocated GATT write payloads for the control path
+_ENABLE_BYTES = bytes([0x01])
+_LED_CODES = [bytes([code]) for code in range(8)]
+
+# Sensors of every connected client, keyed by postfix: (client, led, movement, acc, gyro, mag, keys)
+SENSOR_REGISTRY = {}
+# Newest snapshot of every sensor, keyed by postfix; merged by get_data_func for each publish
+LATEST = {}
+# Every sensor the broker expects, in the order their snapshots are merged
+SENSOR_NAMES = [BLE_NAME_SENSOR_NECK, BLE_NAME_SENSOR_SHOULDER_L, BLE_NAME_SENSOR_SHOULDER_R, BLE_NAME_SENSOR_BACK]
 from bleak import (
     BleakClient,
     discover
@@ -79,6 +102,13 @@ class Service:
     def __init__(self):
         self.data_uuid = None
         self.ctrl_uuid = None
+        self.data_char = None
+        self.ctrl_char = None
+
+    def resolve(self, client):
+        # Look the characteristics up once; bleak takes the objects in place of uuid strings
+        self.data_char = client.services.get_characteristic(self.data_uuid)
+        self.ctrl_char = client.services.get_characteristic(self.ctrl_uuid)
 
 
 class Sensor(Service):
@@ -87,24 +117,46 @@ class Sensor(Service):
         raise NotImplementedError()
 
     async def start_listener(self, client, *args):
+        self.resolve(client)
+
         # start the sensor on the device
-        write_value = bytearray([0x01])
-        await client.write_gatt_char(self.ctrl_uuid, write_value)
+        await client.write_gatt_char(self.ctrl_char, _ENABLE_BYTES)
 
         # listen using the handler
-        await client.start_notify(self.data_uuid, self.callback)
+        await client.start_notify(self.data_char, self.callback)
 
 
 class MovementSensorMPU9250SubService:
 
     def __init__(self):
         self.bits = 0
+        self.axes : slice
+        self.scale : float
+        # Preallocated ring of readings: one float32 xyz row and one timestamp per notification
+        # Only latest() reads it today; the older rows are kept for windowed consumers
+        self.buf = np.zeros((READINGS_BUFFER_LEN, 3), dtype=np.float32)
+        self.ts = np.zeros(READINGS_BUFFER_LEN)
+        self.idx = 0
 
     def enable_bits(self):
         return self.bits
 
-    def cb_sensor(self, data):
-        raise NotImplementedError
+    def bind_callback(self):
+        # Bind the axis slice, scale and buffers once; per packet only the write index is read and stored on self
+        axes = self.axes
+        scale = self.scale
+        buf = self.buf
+        ts_buf = self.ts
+        def cb_sensor(data, ts):
+            i = (self.idx + 1) % READINGS_BUFFER_LEN
+            np.multiply(data[axes], scale, out = buf[i])
+            ts_buf[i] = ts
+            self.idx = i
+        return cb_sensor
+
+    def latest(self):
+        '''Returns (timestamp, xyz) of the newest reading; xyz is a view into the ring'''
+        return self.ts[self.idx], self.buf[self.idx]
 
 
 class MovementSensorMPU9250(Sensor):
@@ -121,67 +173,60 @@ class MovementSensorMPU9250(Sensor):
         self.data_uuid = "f000aa81-0451-4000-b000-000000000000"
         self.ctrl_uuid = "f000aa82-0451-4000-b000-000000000000"
         self.ctrlBits = 0
+        self.ctrl_bytes = _CTRL_STRUCT.pack(self.ctrlBits)
 
         self.sub_callbacks = []
+        # Set on every notification so readers wake on new data instead of polling
+        self.updated = asyncio.Event()
 
     def register(self, cls_obj: MovementSensorMPU9250SubService):
         self.ctrlBits |= cls_obj.enable_bits()
-        self.sub_callbacks.append(cls_obj.cb_sensor)
+        # Packed here once, so start_listener reuses the same bytes on every reconnect
+        self.ctrl_bytes = _CTRL_STRUCT.pack(self.ctrlBits)
+        self.sub_callbacks.append(cls_obj.bind_callback())
 
     async def start_listener(self, client, *args):
+        self.resolve(client)
+
         # start the sensor on the device
-        await client.write_gatt_char(self.ctrl_uuid, struct.pack("<H", self.ctrlBits))
+        await client.write_gatt_char(self.ctrl_char, self.ctrl_bytes)
 
         # listen using the handler
-        await client.start_notify(self.data_uuid, self.callback)
+        await client.start_notify(self.data_char, self.callback)
 
     def callback(self, sender: int, data: bytearray):
-        unpacked_data = struct.unpack("<hhhhhhhhh", data)
+        # One int16 view over the 9 axis values; sub sensors scale their own slice
+        unpacked_data = np.frombuffer(data, dtype='<i2', count=9)
+        # All three sub sensors share the timestamp of this notification
+        ts = getTimeStamp()
         for cb in self.sub_callbacks:
-            cb(unpacked_data)
+            cb(unpacked_data, ts)
+        self.updated.set()
 
 
 class AccelerometerSensorMovementSensorMPU9250(MovementSensorMPU9250SubService):
     def __init__(self):
         super().__init__()
         self.bits = MovementSensorMPU9250.ACCEL_XYZ | MovementSensorMPU9250.ACCEL_RANGE_4G
+        self.axes = slice(3, 6) # (x_accel, y_accel, z_accel) in units of g
         self.scale = 8.0/32768.0 # TODO: why not 4.0, as documented? @Ashwin Need to verify
-        self.readings : list
-
-    def cb_sensor(self, data):
-        '''Returns (x_accel, y_accel, z_accel) in units of g'''
-        rawVals = data[3:6]
-        # print("[MovementSensor] Accelerometer:", tuple([ v*self.scale for v in rawVals ]))
-        self.readings = [getTimeStamp(), tuple([ v*self.scale for v in rawVals ])]
         
 
 class MagnetometerSensorMovementSensorMPU9250(MovementSensorMPU9250SubService):
     def __init__(self):
         super().__init__()
         self.bits = MovementSensorMPU9250.MAG_XYZ
+        self.axes = slice(6, 9) # (x_mag, y_mag, z_mag) in units of uT
         self.scale = 4912.0 / 32760
-        self.readings : list
         # Reference: MPU-9250 register map v1.4
-
-    def cb_sensor(self, data):
-        '''Returns (x_mag, y_mag, z_mag) in units of uT'''
-        rawVals = data[6:9]
-        # print("[MovementSensor] Magnetometer:", tuple([ v*self.scale for v in rawVals ]))
-        self.readings = [getTimeStamp(), tuple([ v*self.scale for v in rawVals ])]
         
 
 class GyroscopeSensorMovementSensorMPU9250(MovementSensorMPU9250SubService):
     def __init__(self):
         super().__init__()
         self.bits = MovementSensorMPU9250.GYRO_XYZ
+        self.axes = slice(0, 3) # (x_gyro, y_gyro, z_gyro) in units of degrees/sec
         self.scale = 500.0/65536.0
-        self.readings : list
-
-    def cb_sensor(self, data):
-        '''Returns (x_gyro, y_gyro, z_gyro) in units of degrees/sec'''
-        rawVals = data[0:3]
-        # print("[MovementSensor] Gyroscope:", tuple([ v*self.scale for v in rawVals ]))
-        self.readings = [getTimeStamp(), tuple([ v*self.scale for v in rawVals ])]
         
 
 class OpticalSensor(Sensor):
@@ -191,10 +236,11 @@ class OpticalSensor(Sensor):
         self.ctrl_uuid = "f000aa72-0451-4000-b000-000000000000"
 
     def callback(self, sender: int, data: bytearray):
-        raw = struct.unpack('<h', data)[0]
+        # 2-byte little-endian SFLOAT: 12-bit mantissa, 4-bit exponent
+        raw = data[0] | (data[1] << 8)
         m = raw & 0xFFF
-        e = (raw & 0xF000) >> 12
-        print("[OpticalSensor] Reading from light sensor:", 0.01 * (m << e))
+        e = raw >> 12
+        log.debug("[OpticalSensor] Reading from light sensor: %s", 0.01 * (m << e))
 
 
 
@@ -205,10 +251,10 @@ class HumiditySensor(Sensor):
         self.ctrl_uuid = "f000aa22-0451-4000-b000-000000000000"
 
     def callback(self, sender: int, data: bytearray):
-        (rawT, rawH) = struct.unpack('<HH', data)
-        temp = -40.0 + 165.0 * (rawT / 65536.0)
-        RH = 100.0 * (rawH/65536.0)
-        print(f"[HumiditySensor] Ambient temp: {temp}; Relative Humidity: {RH}")
+        (rawT, rawH) = _HUMID_STRUCT.unpack_from(data, 0)
+        temp = -40.0 + 165.0 * rawT * _INV_65536
+        RH = 100.0 * rawH * _INV_65536
+        log.debug("[HumiditySensor] Ambient temp: %s; Relative Humidity: %s", temp, RH)
 
 
 class BarometerSensor(Sensor):
@@ -218,10 +264,10 @@ class BarometerSensor(Sensor):
         self.ctrl_uuid = "f000aa42-0451-4000-b000-000000000000"
 
     def callback(self, sender: int, data: bytearray):
-        (tL, tM, tH, pL, pM, pH) = struct.unpack('<BBBBBB', data)
-        temp = (tH*65536 + tM*256 + tL) / 100.0
-        press = (pH*65536 + pM*256 + pL) / 100.0
-        print(f"[BarometerSensor] Ambient temp: {temp}; Pressure Millibars: {press}")
+        # Two little-endian 24-bit fields, combined in place without slicing
+        temp = (data[0] | (data[1] << 8) | (data[2] << 16)) * 0.01
+        press = (data[3] | (data[4] << 8) | (data[5] << 16)) * 0.01
+        log.debug("[BarometerSensor] Ambient temp: %s; Pressure Millibars: %s", temp, press)
 
 
 class LEDAndBuzzer(Service):
@@ -243,37 +289,53 @@ class LEDAndBuzzer(Service):
         super().__init__()
         self.data_uuid = "f000aa65-0451-4000-b000-000000000000"
         self.ctrl_uuid = "f000aa66-0451-4000-b000-000000000000"
+        # Code last written to the device, so repeated notifies skip the GATT round trip
+        self.code = None
+
+    async def enable(self, client):
+        # enable the config; this stays in effect for the rest of the connection
+        await client.write_gatt_char(self.ctrl_char, _ENABLE_BYTES)
 
     async def notify(self, client, code):
-        # enable the config
-        write_value = bytearray([0x01])
-        await client.write_gatt_char(self.ctrl_uuid, write_value)
+        if code == self.code:
+            return
 
         # turn on the red led as stated from the list above using 0x01
-        write_value = bytearray([code])
-        await client.write_gatt_char(self.data_uuid, write_value)
+        await client.write_gatt_char(self.data_char, _LED_CODES[code])
+        self.code = code
 
 # On disconnect from a bleak client, this function is called
 def on_disconnect(client: BleakClient):
     print(f"Disconnected from bleak {BLE_ADDR_TO_NAME[client.address]}!")
 
-async def run(address, postfix, flag, flags, mqtt_flag, warn_flag):
-    global led_and_buzzer
+async def run(address, postfix, flag, flags, all_flags_ready):
+    # Set by the disconnect callback, so this task sleeps instead of checking the client every cycle
+    disconnected = asyncio.Event()
 
     async with BleakClient(address, timeout = 15) as client:
         # Upon bleak client connect, register all the sensors
         if client.is_connected:
-            client.set_disconnected_callback(on_disconnect)
             print(postfix + " bleak is connected!")
 
             # Set buzzer if flag is true.
             led_and_buzzer = LEDAndBuzzer()
+            led_and_buzzer.resolve(client)
+            await led_and_buzzer.enable(client)
 
             acc_sensor = AccelerometerSensorMovementSensorMPU9250()
             gyro_sensor = GyroscopeSensorMovementSensorMPU9250()
             magneto_sensor = MagnetometerSensorMovementSensorMPU9250()
             movement_sensor = MovementSensorMPU9250()
 
+            # Hold the reader and wake it too, so it does not wait forever for data
+            def disconnected_callback(client):
+                on_disconnect(client)
+                flag.clear()
+                all_flags_ready.clear()
+                disconnected.set()
+                movement_sensor.updated.set()
+            client.set_disconnected_callback(disconnected_callback)
+
             movement_sensor.register(acc_sensor)
             movement_sensor.register(gyro_sensor)
             movement_sensor.register(magneto_sensor)
@@ -283,84 +345,91 @@ async def run(address, postfix, flag, flags, mqtt_flag, warn_flag):
                 print("Starting listener for " + postfix)
                 await movement_sensor.start_listener(client)
             except Exception as e:
+                # Without a listener no readings ever arrive, so let main() restart everything
                 print("Fail to start bleak listener for " + postfix)
                 print(e)
-        # Once connected the client should not disconnect
-        # If it does, exception is raised
-        while True:
-            for i in range(10):
-                if warn_flag.is_set():
-                    print("haha")
-                    await led_and_buzzer.notify(client, 0x05)
-                else:
-                    await led_and_buzzer.notify(client, 0x02)
-                await asyncio.sleep(TIME_BETWEEN_READINGS) # Without await, the bleak listener cannot update the readings array, giving errors
-            try:
-                # Check if client is connected, if not raise Exception
-                if not client.is_connected:
-                    print("Bleak client for " + postfix + " not connected")
-                    flag.clear()
-                    raise Exception
-
-                # Set bleak client's flag since bleak client is connected
-                if not flag.is_set():
-                    flag.set()
-                
-                print("--------------------")
-                print("All flags: " + str(all(f.is_set() for f in flags)))
-                # Wait for all the flags to be set before taking readings
-                for f in flags:
-                    await f.wait()
-
-                # Print all the data collected for all the devices
-                print("--------------------")
-                print("All flags: " + str(all(f.is_set() for f in flags)))
-                acc_readings = acc_sensor.readings
-                gyro_readings = gyro_sensor.readings
-                magneto_readings = magneto_sensor.readings
-                print(postfix + ":acc " + str(acc_readings))
-                print(postfix + ":gyro " + str(gyro_readings))
-                print(postfix + ":mag " + str(magneto_readings))
-
-                # Get all readings
-                timestamp = acc_readings[0]
-                acc = list(acc_readings[1])
-                gyro = list(gyro_readings[1])
-                magneto = list(magneto_readings[1])
-
-                # Create a dictionary of readings
-                l = ["accX_", "accY_", "accZ_", "magX_", "magY_", "magZ_", "gyroX_", "gyroY_", "gyroZ_"]
-                sensor_keys = [i + postfix for i in l]
-                sensor_val = []
-                sensor_val.extend(acc)
-                sensor_val.extend(magneto)
-                sensor_val.extend(gyro)
-                zip_iter = zip(sensor_keys, sensor_val)
-                datalist = dict(zip_iter)
-                datalist["Timestamp"] = timestamp
-
-                # Write to json file
-                json_object = json.dumps(datalist)
-                filename = postfix + ".json"
-                with open(filename, "w") as outfile:
-                    outfile.write(json_object)
-
-                # Set mqtt flag after writing to json
-                if not mqtt_flag.is_set():
-                    mqtt_flag.set()
+                raise e
 
+            # Hand the sensors to the shared reader task
+            sensor_keys = [key + postfix for key in READING_KEYS]
+            SENSOR_REGISTRY[postfix] = (client, led_and_buzzer, movement_sensor, acc_sensor, gyro_sensor, magneto_sensor, sensor_keys)
 
+            # Set bleak client's flag since bleak client is connected
+            # The last client to come up releases the reader
+            flag.set()
+            if all(f.is_set() for f in flags):
+                all_flags_ready.set()
 
-            except Exception as e:
-                raise e
+            # Once connected the client should not disconnect
+            await disconnected.wait()
+
+        # If it does, exception is raised
+        print("Bleak client for " + postfix + " not connected")
+        flag.clear()
+        raise Exception
+
+# Wrapped in a coroutine so wait_for cancels a task, not a bare gather future that logs on cancel
+async def wait_for_notifications(sensors):
+    await asyncio.gather(*(sensor[2].updated.wait() for _, sensor in sensors))
+
+# One task snapshots every connected sensor per cycle, instead of one loop per sensor
+async def reader(all_flags_ready, mqtt_flag, warn_flag):
+    while True:
+        # Wait for all the flags to be set before taking readings
+        await all_flags_ready.wait()
+        sensors = list(SENSOR_REGISTRY.items())
+
+        if warn_flag.is_set():
+            log.debug("Warning buzzer on")
+            code = 0x05
+        else:
+            code = 0x02
+        for postfix, (client, led_and_buzzer, *_) in sensors:
+            await led_and_buzzer.notify(client, code)
+
+        # Sleep until every bleak listener has pushed its next notification
+        # A sensor that stays silent raises TimeoutError here, so main() restarts everything
+        await asyncio.wait_for(wait_for_notifications(sensors), NOTIFY_TIMEOUT)
+        # A sensor dropped while we were waiting; main() restarts everything
+        if not all_flags_ready.is_set():
+            continue
+
+        log.debug("--------------------")
+        for postfix, (client, led_and_buzzer, movement_sensor, acc_sensor, gyro_sensor, magneto_sensor, sensor_keys) in sensors:
+            movement_sensor.updated.clear()
+
+            # Print all the data collected for all the devices
+            acc_readings = acc_sensor.latest()
+            gyro_readings = gyro_sensor.latest()
+            magneto_readings = magneto_sensor.latest()
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%s:acc %s", postfix, acc_readings)
+                log.debug("%s:gyro %s", postfix, gyro_readings)
+                log.debug("%s:mag %s", postfix, magneto_readings)
+
+            # Get all readings
+            timestamp = acc_readings[0]
+            sensor_val = np.concatenate((acc_readings[1], magneto_readings[1], gyro_readings[1])).tolist()
+
+            # Update this sensor's dictionary of readings in place; its keys never change
+            datalist = LATEST.setdefault(postfix, {})
+            datalist.update(zip(sensor_keys, sensor_val))
+            datalist["Timestamp"] = timestamp
+
+        # Set mqtt flag after storing the snapshots
+        mqtt_flag.set()
 
 # https://stackoverflow.com/questions/59073556/how-to-cancel-all-remaining-tasks-in-gather-if-one-fails
 async def main(mqtt_client):
     global client
     while True:
         # This finds the bluetooth devices and will not exit untill all devices are visible. However, this does not connect to the devices.
+        # Back off between scans so discovery does not hog the radio and CPU
+        delay = DISCOVERY_BACKOFF_START
         while not await discover_sensors():
             print("waiting for sensors")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DISCOVERY_BACKOFF_MAX)
 
         try:
             # Create flags for each sensor to signal whene each bleak client is connected for each sensor
@@ -378,48 +447,36 @@ async def main(mqtt_client):
                 BLE_NAME_SENSOR_SHOULDER_R: shoulder_r_Flag
             }
 
-            switcher = {
-                BLE_NAME_SENSOR_NECK: neck_Flag,
-                BLE_NAME_SENSOR_BACK: back_Flag,
-                BLE_NAME_SENSOR_SHOULDER_L: shoulder_l_Flag,
-                BLE_NAME_SENSOR_SHOULDER_R: shoulder_r_Flag
-            }
-
-            flags = [switcher[BLE_ADDR_TO_NAME[address]]for address in BLE_ADDR_LIST]
+            # Resolve each address to its name and flag once
+            postfixes = [BLE_ADDR_TO_NAME[address] for address in BLE_ADDR_LIST]
+            flags = [switcher[postfix] for postfix in postfixes]
+            all_flags_ready = asyncio.Event()
             
-            # Create flags for each sensor to signal whene each bleak client is connected for each sensor
-            mqtt_neck_Flag = asyncio.Event()
-            mqtt_back_Flag = asyncio.Event()
-            mqtt_shoulder_r_Flag = asyncio.Event()
-            mqtt_shoulder_l_Flag = asyncio.Event()
-
-            # mqtt_switcher is a switch case statement but in python
-            mqtt_switcher = {
-                BLE_NAME_SENSOR_NECK: mqtt_neck_Flag,
-                BLE_NAME_SENSOR_BACK: mqtt_back_Flag,
-                BLE_NAME_SENSOR_SHOULDER_L: mqtt_shoulder_l_Flag,
-                BLE_NAME_SENSOR_SHOULDER_R: mqtt_shoulder_r_Flag
-            }
-
-            mqtt_flags = [mqtt_switcher[BLE_ADDR_TO_NAME[address]]for address in BLE_ADDR_LIST]
+            # The reader snapshots every sensor at once, so one flag signals a full set of readings
+            mqtt_flag = asyncio.Event()
 
             buzzer_Flag = asyncio.Event()
             mqtt_client.user_data_set(buzzer_Flag)
 
+            SENSOR_REGISTRY.clear()
+            LATEST.clear()
+            load_fallback_snapshots(postfixes)
+
             # Create a list of tasks using list comprehension
             tasks = [
                 asyncio.ensure_future(
                     run(
                         address, 
-                        BLE_ADDR_TO_NAME[address], 
-                        switcher.get(BLE_ADDR_TO_NAME[address]), 
-                        [flags[i] for i in range(len(BLE_ADDR_LIST))], 
-                        mqtt_switcher.get(BLE_ADDR_TO_NAME[address]),
-                        buzzer_Flag
+                        postfix, 
+                        flag, 
+                        flags, 
+                        all_flags_ready
                     )
-                ) for address in BLE_ADDR_LIST]
+                ) for address, postfix, flag in zip(BLE_ADDR_LIST, postfixes, flags)]
+
+            tasks.append(asyncio.ensure_future(reader(all_flags_ready, mqtt_flag, buzzer_Flag)))
 
-            tasks.append(asyncio.ensure_future(mqtt_watcher(mqtt_client, mqtt_flags)))
+            tasks.append(asyncio.ensure_future(mqtt_watcher(mqtt_client, mqtt_flag)))
             # Wait for all tasks
             await asyncio.gather(*tasks)
 
@@ -437,32 +494,35 @@ async def main(mqtt_client):
 
 # Inteface with gateway ble functions
 def get_data_func():
-    filenames = [BLE_NAME_SENSOR_NECK+".json", BLE_NAME_SENSOR_SHOULDER_L+".json", BLE_NAME_SENSOR_SHOULDER_R+".json", BLE_NAME_SENSOR_BACK+".json"]
-    exists = [os.path.exists(filename) for filename in filenames]
-    # If all files exist
-    if all(exist for exist in exists):
-        # Merge the json files
+    # If every sensor has a snapshot
+    if all(name in LATEST for name in SENSOR_NAMES):
+        # Merge the snapshots
         send_dict = {}
-        for filename in filenames:
-            with open(filename, "r") as f:
-                dict_data = json.load(f)
-                send_dict.update(dict_data)
+        for name in SENSOR_NAMES:
+            send_dict.update(LATEST[name])
         return send_dict
     else:
         return
 
-async def mqtt_watcher(mqtt_client, mqtt_flags):
+# Sensors not in BLE_ADDR_LIST are never read live, so the broker would miss their keys.
+# Load their saved <name>.json snapshots once, so every publish still carries the full key set.
+def load_fallback_snapshots(postfixes):
+    for name in SENSOR_NAMES:
+        filename = name + ".json"
+        if name not in postfixes and os.path.exists(filename):
+            with open(filename, "r") as f:
+                LATEST[name] = json.load(f)
+
+async def mqtt_watcher(mqtt_client, mqtt_flag):
     while True:
-        for f in mqtt_flags:
-            await f.wait()
-        for f in mqtt_flags:
-            f.clear()
-        mqtt_send_data(mqtt_client, mqtt_flags)
+        await mqtt_flag.wait()
+        mqtt_flag.clear()
+        mqtt_send_data(mqtt_client)
 
-def mqtt_send_data(mqtt_client, mqtt_flags):
+def mqtt_send_data(mqtt_client):
     send_dict = get_data_func()
     mqtt_client.publish(MQTT_TOPIC_PREDICT, json.dumps(send_dict))
-    print("Published")
+    log.debug("Published")
 
 
 if __name__ == "__main__":
@@ -478,19 +538,17 @@ if __name__ == "__main__":
     )
     os.environ["PYTHONASYNCIODEBUG"] = str(1)
 
-    loop = asyncio.get_event_loop()
-
     # mqtt_client = setup("127.0.0.1")
     
     # To interface with AWS MQTT
     mqtt_client = setup("13.59.198.52")
 
     # Runs the loop forever since main() has a while True loop
+    # asyncio.run cancels leftover tasks and closes the loop on the way out
     try:
-        loop.run_until_complete(main(mqtt_client))
+        asyncio.run(main(mqtt_client))
 
     # Something unexpected happened, whole program will close
     except Exception as e:
         print(e)
-        loop.close()
 
@@ -52,5 +52,4 @@ async def run():
     #     print("Connected:", client.is_connected)
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(run())
+    asyncio.run(run())
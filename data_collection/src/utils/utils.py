@@ -1,7 +1,10 @@
 from datetime import datetime
 import pandas as pd
+import csv
 import os
 
+CSV_WRITE_BUFFER = 1 << 16
+
 def getTimeStamp():
     return datetime.timestamp(datetime.now())
 
@@ -13,21 +16,26 @@ def getRowFromDatalists(datalists):
         timestamp = datalists[0]["acc"][id][0]
         tmp = [timestamp]
         for datalist in datalists:
+            # Same acc, mag, gyro order as the header from getColumnsFromPostfixes
             tmp += [ 
                 *datalist["acc"][id][1], 
-                *datalist["gyro"][id][1], 
-                *datalist["mag"][id][1] 
+                *datalist["mag"][id][1], 
+                *datalist["gyro"][id][1] 
             ]
         # tmp += [classification]
-        # rows.append(tmp)
+        rows.append(tmp)
     return rows
 
-def getDataframeFromDatalist(datalists, postfixes):
+def getColumnsFromPostfixes(postfixes):
     dev_data = ["accX", "accY", "accZ", "magX", "magY", "magZ", "gyroX", "gyroY", "gyroZ"]
     column = ["Timestamp"] 
     for postfix in postfixes:
         column += [col + "_%s" % (postfix) for col in dev_data]
     # column += ["Classification"]
+    return column
+
+def getDataframeFromDatalist(datalists, postfixes):
+    column = getColumnsFromPostfixes(postfixes)
     # print(column)
 
     # rows = getRowFromDatalists(datalists, classification)
@@ -44,6 +52,17 @@ def saveDataframeToCsv(df, filename):
     with open(filename, "w") as f:
         df.to_csv(f, index = False, line_terminator='\n')
 
+# Open the csv once in append mode, writing the header only if the file is new.
+# Rows are then appended in batches instead of rewriting the whole dataframe.
+def openCsvForAppend(filename, postfixes):
+    f = open(filename, "a", newline = "", buffering = CSV_WRITE_BUFFER)
+    if f.tell() == 0:
+        csv.writer(f, lineterminator = "\n").writerow(getColumnsFromPostfixes(postfixes))
+    return f
+
+def appendDatalistsToCsv(f, datalists):
+    csv.writer(f, lineterminator = "\n").writerows(getRowFromDatalists(datalists))
+
 def appendDataToDataframe(df, datalists, postfixes, classification):
     df_append = getDataframeFromDatalist(datalists, postfixes, classification)
     print(df_append)
@@ -67,24 +86,6 @@ if __name__ == "__main__":
 
             "mag" : [[1635031407.178796, (0.0, 0.0, 0.0)], [1635031408.137214, (-83.36605616605617, -20.09181929181929, 24.29010989010989)], [1635031409.159121, (-83.66593406593407, -22.19096459096459, 28.338461538461537)], [1635031410.178374, (-79.61758241758241, -22.34090354090354, 31.637118437118435)], [1635031411.138511, (-78.56800976800976, -22.79072039072039, 32.686691086691084)], [1635031412.218498, (-79.01782661782661, -21.89108669108669, 32.536752136752135)], [1635031413.178628, (-78.71794871794872, -22.94065934065934, 32.536752136752135)], [1635031414.137772, (-77.66837606837606, -21.14139194139194, 32.236874236874236)], [1635031415.158625, (-79.01782661782661, -22.64078144078144, 31.487179487179485)]]
         }
-    if os.path.exists("out.csv"):
-        df = loadDataframeFromCsv("out.csv")
-        print(df)
-    else:
-        df = getDataframeFromDatalist(
-            [datalist1, datalist2],
-            ["neck", "shoulders"], 
-            1
-        )
-        saveDataframeToCsv(df, "out.csv")
-
-    df = appendDataToDataframe(
-        df,
-        [datalist1, datalist2],
-        ["neck", "shoulders"], 
-        1 
-    )
-
-    print(df)
-    saveDataframeToCsv(df, "out.csv")
-
+    with openCsvForAppend("out.csv", ["neck", "shoulders"]) as f:
+        appendDatalistsToCsv(f, [datalist1, datalist2])
+        appendDatalistsToCsv(f, [datalist1, datalist2])